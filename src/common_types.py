@@ -17,7 +17,7 @@ import dataclasses
 from enum import Enum
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class GnmiPaths:
     """gNMI paths and datamodels to be subscribed"""
     xpath_list: list[str]
@@ -26,10 +26,10 @@ class GnmiPaths:
     target: str
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class GnmiMetric:
     """Single metric data"""
-    labelval: list[str] = dataclasses.field(default_factory=list)
+    labelval: tuple[str, ...] = dataclasses.field(default_factory=tuple)
     val: int = 0
     ts: float = 0.0
 
@@ -41,7 +41,7 @@ class GnmiMetricType(Enum):
     GAUGE = 2
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class GnmiMetricBundle:
     """A bundle of GnmiMetric(s) with related metadata"""
     type: GnmiMetricType = GnmiMetricType.UNKNOWN
@@ -51,13 +51,16 @@ class GnmiMetricBundle:
     labelset: list[str] = dataclasses.field(default_factory=list)
     metrics: list[GnmiMetric] = dataclasses.field(default_factory=list)
 
+    def add_metric(self, labelval: tuple[str, ...], val: int, ts: float) -> None:
+        """Appends a metric to the bundle. Label values must match the bundle labelset"""
+        if len(labelval) != len(self.labelset):
+            raise ValueError(f"{self.metric_name}: {len(labelval)} label values provided, "
+                             f"{len(self.labelset)} expected.")
+        self.metrics.append(GnmiMetric(labelval=labelval, val=val, ts=ts))
+
     def is_valid(self) -> bool:
-        if (not isinstance(self.metric_name, str)
-                or not self.device_name
-                or not self.metric_name
-                or self.type == GnmiMetricType.UNKNOWN):
-            return False
-        for mt in self.metrics:
-            if len(mt.labelval) != len(self.labelset):
-                return False
-        return True
+        # Label values arity is enforced by add_metric()
+        return (isinstance(self.metric_name, str)
+                and bool(self.device_name)
+                and bool(self.metric_name)
+                and self.type != GnmiMetricType.UNKNOWN)
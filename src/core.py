@@ -16,6 +16,7 @@
 # Modules
 import logging
 import signal
+import threading
 from typing import Any
 
 
@@ -27,17 +28,18 @@ from src.gnmi_client.client import GnmiClient
 class App:
     """ Application main module """
     def __init__(self, raw_cfg: dict):
-        self._global_cfg: dict[str, str] = {}
+        self._global_cfg: dict[str, Any] = {}
         self._devices_cfg: list[dict[str, Any]] = []
         self._parse_raw_cfg(raw_cfg)
 
         self._prom_client: PromClient
         self._devices_list: list[GnmiClient] = []
+        self._shutdown_event = threading.Event()
 
     def start(self) -> None:
         # Registering os signals
-        signal.signal(signal.SIGINT, self.close)
-        signal.signal(signal.SIGTERM, self.close)
+        signal.signal(signal.SIGINT, self._signal_handler)
+        signal.signal(signal.SIGTERM, self._signal_handler)
 
         # Load Prometheus client
         logging.info(f"Initializing Prometheus exporter module...")
@@ -54,38 +56,37 @@ class App:
                 plug_cnt += 1
         logging.info(f"{len(self._devices_list)} device(s) and {plug_cnt} plugin(s) successfully loaded...")
 
-        # Wait for termination signal
-        signal.pause()
+        # Wait for termination signal, then shut down outside the signal handler
+        self._shutdown_event.wait()
+        self.close()
         return
 
-    def close(self, signum, frame) -> None:
-        self._prom_client.unregister_all()
+    def _signal_handler(self, signum, frame) -> None:
+        self._shutdown_event.set()
+
+    def close(self) -> None:
+        # gNMI clients run on the exporter event loop: close them before releasing the exporter
         for device in self._devices_list:
             device.close()
+        self._prom_client.unregister_all()
+        self._prom_client.stop()
 
     def _parse_raw_cfg(self, raw_cfg: dict) -> None:
-        # Global config
-        for key, value in raw_cfg['global'].items():
-            self._global_cfg[key] = str(value)
+        # Global config (values keep their YAML types, consumers coerce them)
+        self._global_cfg = dict(raw_cfg['global'])
 
         # Device template
         plugins_tpl: set[str] = set()
         devices_tpl: dict[str, Any] = {}
-        if 'device_template' in raw_cfg:
-            if 'plugins' in raw_cfg['device_template'] and isinstance(raw_cfg['device_template']['plugins'], list):
-                plugins_tpl = set(raw_cfg['device_template'].pop('plugins'))
-            for key, value in raw_cfg['device_template'].items():
-                devices_tpl[key] = str(value)
+        if isinstance(raw_cfg.get('device_template'), dict):
+            devices_tpl = {key: value for key, value in raw_cfg['device_template'].items() if key != 'plugins'}
+            if isinstance(raw_cfg['device_template'].get('plugins'), list):
+                plugins_tpl = set(raw_cfg['device_template']['plugins'])
 
         # Devices
         for device in raw_cfg['devices']:
-            new_dev = devices_tpl.copy()
-            if 'plugins' in device:
-                new_dev['plugins'] = set(device.pop('plugins'))
-            else:
-                new_dev['plugins'] = plugins_tpl.copy()
-            for key, value in device.items():
-                new_dev[key] = str(value)
+            new_dev = {**devices_tpl, **device}
+            new_dev['plugins'] = set(device['plugins']) if 'plugins' in device else plugins_tpl.copy()
             self._devices_cfg.append(new_dev)
 
         return
@@ -14,12 +14,20 @@
 """
 
 # Modules
+import sys
 import time
+import socket
 import asyncio
-from threading import Lock
+import logging
+import itertools
+import concurrent.futures
+from threading import BoundedSemaphore, Lock, Thread
 from typing import Protocol
-from dataclasses import dataclass
-from prometheus_client import start_http_server
+import dataclasses
+from dataclasses import dataclass, field
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+from prometheus_client.exposition import make_wsgi_app
+from prometheus_client.samples import Sample
 from prometheus_client.registry import Collector
 from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily, REGISTRY
 
@@ -27,19 +35,72 @@ from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily, REGIS
 from src.common_types import GnmiMetricBundle, GnmiMetricType, GnmiMetric
 
 
+# Constants
+_INSTANCE_LABELSET = ['instance_name']
+_HTTP_POLL_INTERVAL = 0.1  # http server shutdown latency (seconds)
+
+
 # Interfaces
 class Plugin(Protocol):
     async def fetch_metric_bundles(self) -> list[GnmiMetricBundle]:
         ...
 
 
-@dataclass
+@dataclass(slots=True)
 class _PromClientConfig:
     """PromClient config"""
     instance_name: str = 'default'
     listen_address: str = '0.0.0.0'
     listen_port: int = 9456
     metric_prefix: str = 'gnmi'
+    scrape_interval: int = 60
+    http_max_workers: int = 4
+
+
+@dataclass(slots=True)
+class _ScrapeSnapshot:
+    """Data gathered by a single scrape"""
+    bundle_table: dict[str, GnmiMetricBundle] = field(default_factory=dict)
+    collected_devices: int = 0
+    collected_plugins: int = 0
+
+
+class _SilentRequestHandler(WSGIRequestHandler):
+    """HTTP request handler without per-request access logging"""
+    def log_message(self, format, *args):
+        pass
+
+
+class _PooledWSGIServer(WSGIServer):
+    """WSGI server serving requests from a bounded pool of worker threads.
+    When all the workers are busy, new connections wait in the listen backlog.
+    """
+    def __init__(self, server_address: tuple[str, int], max_workers: int):
+        # WSGIServer defaults to AF_INET: pick the address family from the listen address (IPv6 support)
+        host, port = server_address
+        family, _, _, _, sockaddr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        self.address_family = family
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prom-http')
+        self._slots = BoundedSemaphore(max_workers)
+        super().__init__((str(sockaddr[0]), port), _SilentRequestHandler)
+
+    def process_request(self, request, client_address) -> None:
+        # Do not queue more requests than workers
+        self._slots.acquire()
+        self._pool.submit(self._process_request_worker, request, client_address)
+
+    def _process_request_worker(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
 
 
 class PromClient(Collector):
@@ -47,38 +108,70 @@ class PromClient(Collector):
     def __init__(self, global_cfg: dict):
         self._config = _PromClientConfig()
         self._parse_config(global_cfg)
+        self._instance_labelval = (sys.intern(self._config.instance_name),)
 
-        self._plugin_list: list[Plugin] = []
+        self._plugins: tuple[Plugin, ...] = ()  # Copy-on-write snapshot, swapped under mutex
         self._mutex = Lock()
-        self._bundle_table: dict[str, GnmiMetricBundle] = {}
-        self._collected_devices: int = 0
-        self._collected_plugins: int = 0
+
+        # Long-lived event loop used to query plugins at every scrape (and to run gNMI clients)
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = Thread(target=self._loop.run_forever, name='prom-client-loop', daemon=True)
+
+        # Metrics http server
+        self._httpd: WSGIServer
+        self._httpd_thread: Thread
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """ Exporter event loop, shared with the gNMI clients """
+        return self._loop
 
     def register_plugin(self, plug: Plugin) -> None:
         """ Register Plugin() instances here"""
         with self._mutex:
-            self._plugin_list.append(plug)
+            self._plugins = self._plugins + (plug,)
 
     def unregister_all(self) -> None:
         """ Release all the registered devices """
         with self._mutex:
-            self._plugin_list.clear()
+            self._plugins = ()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def stop(self) -> None:
+        """ Stop the Prometheus http server """
+        REGISTRY.unregister(self)
+        self._httpd.shutdown()
+        self._httpd.server_close()
 
     def start(self) -> None:
         """ Register and start Prometheus http server """
+        self._loop_thread.start()
         REGISTRY.register(self)
-        start_http_server(self._config.listen_port, self._config.listen_address)
+
+        self._httpd = _PooledWSGIServer((self._config.listen_address, self._config.listen_port),
+                                        max_workers=self._config.http_max_workers)
+        self._httpd.set_app(make_wsgi_app(REGISTRY))
+        self._httpd_thread = Thread(target=self._httpd.serve_forever, kwargs={'poll_interval': _HTTP_POLL_INTERVAL},
+                                   name='prom-client-http', daemon=True)
+        self._httpd_thread.start()
 
     def collect(self):
         """ Scrape event occurred """
-        # Gather data
-        asyncio.run(self._query_plugins())
+        # Gather data. Every scrape gets its own snapshot, so overlapping scrapes never share state
+        snapshot = _ScrapeSnapshot()
+        if self._loop.is_running():
+            fut = asyncio.run_coroutine_threadsafe(self._query_plugins(), self._loop)
+            try:
+                snapshot = fut.result(timeout=self._config.scrape_interval)
+            except concurrent.futures.TimeoutError:
+                fut.cancel()
+                logging.error(f"Plugins query did not complete within {self._config.scrape_interval} seconds.")
 
         # Compute self-statistics
-        self._compute_stats()
+        self._compute_stats(snapshot)
 
         # Export the metrics bundle table
-        for bundle in self._bundle_table.values():
+        for bundle in snapshot.bundle_table.values():
             if bundle.type == GnmiMetricType.UNKNOWN:
                 continue
 
@@ -87,10 +180,10 @@ class PromClient(Collector):
                 c = CounterMetricFamily(name=bundle.metric_name,
                                         documentation=bundle.documentation,
                                         labels=bundle.labelset)
-                for metric in bundle.metrics:
-                    c.add_metric(labels=metric.labelval,
-                                 value=float(metric.val),
-                                 timestamp=metric.ts)
+                sample_name = c.name + '_total'
+                labelset = bundle.labelset
+                c.samples = [Sample(sample_name, dict(zip(labelset, metric.labelval)), metric.val, metric.ts)
+                             for metric in bundle.metrics]
                 yield c
 
             # Exporting Gauge metrics types
@@ -98,118 +191,97 @@ class PromClient(Collector):
                 g = GaugeMetricFamily(name=bundle.metric_name,
                                       documentation=bundle.documentation,
                                       labels=bundle.labelset)
-                for metric in bundle.metrics:
-                    g.add_metric(labels=metric.labelval,
-                                 value=metric.val,
-                                 timestamp=metric.ts)
+                sample_name = g.name
+                labelset = bundle.labelset
+                g.samples = [Sample(sample_name, dict(zip(labelset, metric.labelval)), metric.val, metric.ts)
+                             for metric in bundle.metrics]
                 yield g
 
-        # Clear (and release memory) bundle table
-        self._bundle_table.clear()
-
-    async def _query_plugins(self) -> None:
+    async def _query_plugins(self) -> '_ScrapeSnapshot':
         """ Gather metrics from plugins (concurrently) """
-        self._collected_plugins = 0
-        self._collected_devices = 0
+        snapshot = _ScrapeSnapshot()
 
-        if self._plugin_list:
+        # Take a snapshot of the registered plugins. No lock is held while querying
+        plugins = self._plugins
+        if plugins:
             # Query plugins
-            self._mutex.acquire()
-            coro_list = []
-            for plugin in self._plugin_list:
-                coro_list.append(plugin.fetch_metric_bundles())
-
-            response = await asyncio.gather(*coro_list)
-            self._mutex.release()
+            response = await asyncio.gather(*[plugin.fetch_metric_bundles() for plugin in plugins])
 
-            # Walk the plugin list (response)
+            # Walk the plugin list (response), grouping valid bundles by metric name
+            pending: dict[str, tuple[GnmiMetricBundle, list[list[GnmiMetric]]]] = {}
+            device_names: set[str] = set()
             for plugin in response:
                 # Check if the plugin returned something
-                if (isinstance(plugin, list)
-                   and plugin
-                   and isinstance(plugin[0], GnmiMetricBundle)
-                   and plugin[0].is_valid()):
-                    # Update collected plugins gauge
-                    self._collected_plugins += 1
-                else:
+                if not isinstance(plugin, list):
                     continue
 
-                # Add plugin returned data to bundle table
-                device_names = set()
+                collected = False
                 for bundle in plugin:
                     if isinstance(bundle, GnmiMetricBundle) and bundle.is_valid():
+                        collected = True
                         device_names.add(bundle.device_name)
-                        if bundle.metric_name not in self._bundle_table:
-                            self._bundle_table[bundle.metric_name] = bundle
-                        else:
-                            self._bundle_table[bundle.metric_name].metrics.extend(bundle.metrics)
+                        pending.setdefault(bundle.metric_name, (bundle, []))[1].append(bundle.metrics)
+
+                # Update collected plugins gauge
+                if collected:
+                    snapshot.collected_plugins += 1
 
-                # Update collected devices gauge
-                self._collected_devices = len(device_names)
+            # Update collected devices gauge
+            snapshot.collected_devices = len(device_names)
 
-    def _compute_stats(self) -> None:
+            # Add plugins returned data to bundle table (one merge per metric name).
+            # Plugins may reuse their bundles across scrapes: the snapshot keeps its own shallow copies
+            for name, (bundle, chunks) in pending.items():
+                metrics = chunks[0] if len(chunks) == 1 else list(itertools.chain.from_iterable(chunks))
+                snapshot.bundle_table[name] = dataclasses.replace(bundle, metrics=metrics)
+
+        return snapshot
+
+    def _compute_stats(self, snapshot: '_ScrapeSnapshot') -> None:
         """ gNMI Exporter self diagnostic metrics """
+        ts = time.time()  # Seconds since epoch, shared by all self-metrics of this scrape
+
         # Configured devices
-        g = GnmiMetricBundle(type=GnmiMetricType.GAUGE,
-                             metric_name=self._config.metric_prefix + '_configured_devices',
-                             documentation='Number of configured devices',
-                             labelset=['instance_name'],
-                             metrics=[GnmiMetric(labelval=[self._config.instance_name],
-                                                 val=len(self._plugin_list),
-                                                 ts=time.time())])
-        self._bundle_table['configured_devices'] = g
+        self._stat_bundle(snapshot, 'configured_devices', 'Number of configured devices', len(self._plugins), ts)
 
         # Collect devices
-        g = GnmiMetricBundle(type=GnmiMetricType.GAUGE,
-                             metric_name=self._config.metric_prefix + '_collected_devices',
-                             documentation='Number of actively monitored devices',
-                             labelset=['instance_name'],
-                             metrics=[GnmiMetric(labelval=[self._config.instance_name],
-                                                 val=self._collected_devices,
-                                                 ts=time.time())])
-        self._bundle_table['collected_devices'] = g
+        self._stat_bundle(snapshot, 'collected_devices', 'Number of actively monitored devices',
+                          snapshot.collected_devices, ts)
 
         # Collected plugins
-        g = GnmiMetricBundle(type=GnmiMetricType.GAUGE,
-                             metric_name=self._config.metric_prefix + '_collected_plugins',
-                             documentation='Number of actively monitored plugin instances',
-                             labelset=['instance_name'],
-                             metrics=[GnmiMetric(labelval=[self._config.instance_name],
-                                                 val=self._collected_plugins,
-                                                 ts=time.time())])
-        self._bundle_table['collected_plugins'] = g
+        self._stat_bundle(snapshot, 'collected_plugins', 'Number of actively monitored plugin instances',
+                          snapshot.collected_plugins, ts)
 
         # Collected metrics
-        g = GnmiMetricBundle(type=GnmiMetricType.GAUGE,
-                             metric_name=self._config.metric_prefix + '_collected_metrics',
-                             documentation='Number of collected metrics',
-                             labelset=['instance_name'],
-                             metrics=[GnmiMetric(labelval=[self._config.instance_name],
-                                                 val=len(self._bundle_table) + 1,  # +1 is this metric
-                                                 ts=time.time())])
-        self._bundle_table['collected_metrics'] = g
+        self._stat_bundle(snapshot, 'collected_metrics', 'Number of collected metrics',
+                          len(snapshot.bundle_table) + 1, ts)  # +1 is this metric
 
         # Collected series
         collected_series = 0
-        for metric in self._bundle_table.values():
+        for metric in snapshot.bundle_table.values():
             collected_series += len(metric.metrics)
+        self._stat_bundle(snapshot, 'collected_series', 'Number of collected series', collected_series, ts)
 
-        g = GnmiMetricBundle(type=GnmiMetricType.GAUGE,
-                             metric_name=self._config.metric_prefix + '_collected_series',
-                             documentation='Number of collected series',
-                             labelset=['instance_name'],
-                             metrics=[GnmiMetric(labelval=[self._config.instance_name],
-                                                 val=collected_series,
-                                                 ts=time.time())])
-        self._bundle_table['collected_series'] = g
+    def _stat_bundle(self, snapshot: '_ScrapeSnapshot', name: str, documentation: str, val: int, ts: float) -> None:
+        """ Add a single-series self diagnostic gauge to the bundle table """
+        bundle = GnmiMetricBundle(type=GnmiMetricType.GAUGE,
+                                  metric_name=f"{self._config.metric_prefix}_{name}",
+                                  documentation=documentation,
+                                  labelset=_INSTANCE_LABELSET)
+        bundle.add_metric(labelval=self._instance_labelval, val=val, ts=ts)
+        snapshot.bundle_table[name] = bundle
 
     def _parse_config(self, global_cfg: dict) -> None:
         """ Parse and load user config """
         if 'instance_name' in global_cfg:
-            self._config.instance_name = global_cfg['instance_name']
+            self._config.instance_name = str(global_cfg['instance_name'])
         if 'listen_address' in global_cfg:
-            self._config.listen_address = global_cfg['listen_address']
+            self._config.listen_address = str(global_cfg['listen_address'])
         if 'listen_port' in global_cfg:
             self._config.listen_port = int(global_cfg['listen_port'])
         if 'metric_prefix' in global_cfg:
-            self._config.metric_prefix = global_cfg['metric_prefix']
+            self._config.metric_prefix = str(global_cfg['metric_prefix'])
+        if 'scrape_interval' in global_cfg:
+            self._config.scrape_interval = int(global_cfg['scrape_interval'])
+        if 'http_max_workers' in global_cfg:
+            self._config.http_max_workers = int(global_cfg['http_max_workers'])
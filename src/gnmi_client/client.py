@@ -15,12 +15,13 @@
 
 # Modules
 import grpc  # type: ignore
+import asyncio
 import logging
-import threading
 import dataclasses
+import concurrent.futures
 from enum import Enum
 from typing import Any
-from collections.abc import Callable, Iterable
+from collections.abc import Callable
 
 # Local Modules
 import src.common_types as ct
@@ -34,7 +35,7 @@ from src.plugins.base_plug import BasePlugin
 from src.plugins.oc_interfaces.oc_if import OcInterfaces
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, slots=True)
 class _DataModel:
     """yang DataModel infos"""
     name: str
@@ -59,9 +60,38 @@ class DialError(utils.Error):
 _RPC_TIMEOUT = 10
 _RECONNECT_TIMEOUT = 10
 _PREFERRED_ENCODINGS = (_EncodingTypes.PROTO, _EncodingTypes.JSON, _EncodingTypes.JSON_IETF, _EncodingTypes.ASCII)
+_CHANNEL_OPTIONS = (('grpc.keepalive_time_ms', 30_000), ('grpc.http2.max_pings_without_data', 0))
+
+
+class ChannelPool:
+    """Shares gRPC channels among the clients dialing the same target.
+    Credentials are per-RPC metadata, so the channel only depends on the target address.
+    """
+    def __init__(self):
+        self._channels: dict[str, tuple[grpc.aio.Channel, int]] = {}
+
+    def get(self, target: str) -> grpc.aio.Channel:
+        channel, refcount = self._channels.get(target, (None, 0))
+        if channel is None:
+            # TODO: Handle ssl channels
+            channel = grpc.aio.insecure_channel(target=target, options=_CHANNEL_OPTIONS)
+        self._channels[target] = (channel, refcount + 1)
+        return channel
+
+    async def release(self, target: str) -> None:
+        channel, refcount = self._channels[target]
+        if refcount > 1:
+            self._channels[target] = (channel, refcount - 1)
+            return
+        del self._channels[target]
+        await channel.close()
+
+
+# All clients run on the exporter event loop, so the pool needs no locking
+_channel_pool = ChannelPool()
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class _GnmiClientConfig:
     """GnmiClient configuration keys """
     scrape_interval: int = 60
@@ -77,23 +107,24 @@ class _GnmiClientConfig:
     plugins: set[str] = dataclasses.field(default_factory=set)
 
 
-class GnmiClient(threading.Thread):
-    def __init__(self, global_cfg: dict[str, str], device_cfg: dict[str, Any], exporter: PromClient):
+class GnmiClient:
+    def __init__(self, global_cfg: dict[str, Any], device_cfg: dict[str, Any], exporter: PromClient):
         # Config
         self._config = _GnmiClientConfig()
         self._parse_config(global_cfg, device_cfg)
 
-        # Client logic
-        super().__init__(name=self._config.dev_name)
-        self._mutex = threading.Lock()
+        # Client logic (runs on the exporter event loop)
+        self._loop = exporter.loop
+        self._future: concurrent.futures.Future
         self._exit: bool = False
-        self._event = threading.Event()
+        self._event = asyncio.Event()
         self._plugin_table: dict[str, BasePlugin] = {}
         self._path_list: list[ct.GnmiPaths] = []
 
         # Target related
         self._target = f"{self._config.ip}:{self._config.port}"
-        self._creds = [('username', self._config.user), ('password', self._config.password)]
+        self._creds: tuple[tuple[str, str], ...] = (('username', self._config.user),
+                                                    ('password', self._config.password))
         self._selected_encoding = _EncodingTypes.JSON
 
         # Load plugins
@@ -101,12 +132,24 @@ class GnmiClient(threading.Thread):
             if plugin == 'oc_interfaces':
                 self._plugin_table[plugin] = OcInterfaces(global_cfg, device_cfg, exporter)
                 self._path_list.append(self._plugin_table[plugin].get_paths())
+        self._plugin_tuple: tuple[BasePlugin, ...] = tuple(self._plugin_table.values())
+
+        # SubscribeResponse handlers, keyed by the 'response' oneof field name
+        self._dispatch: dict[str | None, Callable[[gnmi_pb2.SubscribeResponse], None]] = {
+            'update': self._handle_update,
+            'sync_response': self._handle_sync}
+
+        # Subscription paths are static for the client lifetime: parse them once
+        self._gnmi_path_list: list[list[gnmi_pb2.Path]] = [self._parse_xpaths(p) for p in self._path_list]
+        self._sub_requests: dict[_EncodingTypes, list[gnmi_pb2.SubscribeRequest]] = {
+            self._selected_encoding: self._build_sub_requests(self._selected_encoding)}
 
-    def run(self):
-        sub_response = [gnmi_pb2.SubscribeResponse()]
+    def start(self) -> None:
+        self._future = asyncio.run_coroutine_threadsafe(self.run(), self._loop)
+
+    async def run(self) -> None:
         while True:
-            channel = self._create_channel()
-            stub = gnmi_pb2_grpc.gNMIStub(channel)
+            stub = gnmi_pb2_grpc.gNMIStub(_channel_pool.get(self._target))
             wd = _WatchDog(timeout=self._config.scrape_interval * self._config.wd_multiplier,
                            expired_handler=self._event.set)
 
@@ -114,18 +157,20 @@ class GnmiClient(threading.Thread):
             while True:
                 try:
                     logging.info(f"Connecting to {self._config.dev_name} ...")
-                    self._check_caps(stub)  # Check if the device supports required features
+                    await self._check_caps(stub)  # Check if the device supports required features
                     sub_response = self._subscribe(stub)  # Subscribe
                 except DialError as dial_err:
                     logging.error(dial_err)
-                    self._event.wait(timeout=_RECONNECT_TIMEOUT)
+                    try:
+                        await asyncio.wait_for(self._event.wait(), timeout=_RECONNECT_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        pass
                     # Time to exit?
-                    with self._mutex:
-                        if self._exit:
-                            channel.close()
-                            return
-                        else:
-                            continue
+                    if self._exit:
+                        await _channel_pool.release(self._target)
+                        return
+                    else:
+                        continue
                 # Done!
                 logging.info(f"{self._config.dev_name} is now online ...")
                 break
@@ -139,58 +184,65 @@ class GnmiClient(threading.Thread):
             wd.start()
             gnmi_collector.start()
 
-            # Put this thread in wait state while receiving telemetries
-            self._event.wait()
+            # Put this task in wait state while receiving telemetries
+            await self._event.wait()
 
             # Cleaning up...
-            for plugin in self._plugin_table.values():
+            for plugin in self._plugin_tuple:
                 plugin.set_sync_status(False)
             self._event.clear()
             wd.stop()
-            channel.close()
-            gnmi_collector.wait_for_stop()
+            await gnmi_collector.wait_for_stop()
+            await _channel_pool.release(self._target)
 
             # Time to exit?
-            with self._mutex:
-                if self._exit:
-                    break
+            if self._exit:
+                break
 
     def close(self) -> None:
-        with self._mutex:
-            self._exit = True
-        self._event.set()
-        self.join()
+        self._loop.call_soon_threadsafe(self._request_exit)
+        self._future.result()
 
-    def _create_channel(self) -> grpc.Channel:
-        # TODO: Handle ssl channels
-        return grpc.insecure_channel(target=self._target, options=self._creds)
+    def _request_exit(self) -> None:
+        self._exit = True
+        self._event.set()
 
     def route_gnmi_sr(self, sr: gnmi_pb2.SubscribeResponse) -> None:
         # Note: gNMI Extensions are not implemented (yet)
-        if sr.HasField('update'):  # This is a gNMI Notification
-            if self._config.bypass_msg_routing:
-                # Broadcast msg to all plugins
-                for plugin in self._plugin_table.values():
-                    plugin.gnmi_notification_handler(sr.update)
-            elif sr.update.prefix.target in self._plugin_table.keys():
-                # Normal message routing
-                self._plugin_table[sr.update.prefix.target].gnmi_notification_handler(sr.update)
-            else:
-                # This should not happen. It means that the device does not support path targets
-                # https://github.com/openconfig/reference/blob/master/rpc/gnmi/gnmi-specification.md#2221-path-target
-                logging.error(f"{self._config.dev_name} does not support path target. Enable <bypass_msg_routing>.")
-
-        elif sr.HasField('sync_response'):  # This is a sync_response message (bool)
-            # sync_response must be broadcasted to all plugins
-            for plugin in self._plugin_table.values():
-                plugin.set_sync_status(sr.sync_response)
-
-    def _check_caps(self, stub: gnmi_pb2_grpc.gNMIStub) -> None:
+        handler = self._dispatch.get(sr.WhichOneof('response'))
+        if handler is not None:
+            handler(sr)
+
+    def _handle_update(self, sr: gnmi_pb2.SubscribeResponse) -> None:
+        """This is a gNMI Notification"""
+        update = sr.update
+        if self._config.bypass_msg_routing:
+            # Broadcast msg to all plugins
+            for plugin in self._plugin_tuple:
+                plugin.gnmi_notification_handler(update)
+            return
+
+        # Normal message routing
+        target_plugin = self._plugin_table.get(update.prefix.target)
+        if target_plugin is not None:
+            target_plugin.gnmi_notification_handler(update)
+        else:
+            # This should not happen. It means that the device does not support path targets
+            # https://github.com/openconfig/reference/blob/master/rpc/gnmi/gnmi-specification.md#2221-path-target
+            logging.error(f"{self._config.dev_name} does not support path target. Enable <bypass_msg_routing>.")
+
+    def _handle_sync(self, sr: gnmi_pb2.SubscribeResponse) -> None:
+        """This is a sync_response message (bool)"""
+        # sync_response must be broadcasted to all plugins
+        for plugin in self._plugin_tuple:
+            plugin.set_sync_status(sr.sync_response)
+
+    async def _check_caps(self, stub: gnmi_pb2_grpc.gNMIStub) -> None:
         req = gnmi_pb2.CapabilityRequest()
 
         # ======= Get device capabilities =======
         try:
-            resp: gnmi_pb2.CapabilityResponse = stub.Capabilities(req, metadata=self._creds, timeout=_RPC_TIMEOUT)
+            resp: gnmi_pb2.CapabilityResponse = await stub.Capabilities(req, metadata=self._creds, timeout=_RPC_TIMEOUT)
         except grpc.RpcError as rpc_error:
             raise DialError(f"gNMI capabilities() call to {self._config.dev_name} failed with: {rpc_error.code()}")
 
@@ -216,29 +268,36 @@ class GnmiClient(threading.Thread):
                     self._selected_encoding = enc
                     break
 
-    def _subscribe(self, stub: gnmi_pb2_grpc.gNMIStub) -> gnmi_pb2.SubscribeResponse:
+    def _subscribe(self, stub: gnmi_pb2_grpc.gNMIStub) -> grpc.aio.StreamStreamCall:
+        # Requests only depend on the selected encoding: build them once and reuse them on reconnect
+        req_list = self._sub_requests.get(self._selected_encoding)
+        if req_list is None:
+            req_list = self._build_sub_requests(self._selected_encoding)
+            self._sub_requests[self._selected_encoding] = req_list
+
+        # Subscribe to target
+        try:
+            return stub.Subscribe(iter(req_list), metadata=self._creds)
+        except grpc.RpcError as rpc_error:
+            raise DialError(f"gNMI stream from {self._target} failed with: {rpc_error.code()}"
+                            f" - details: {rpc_error.details()}")
+
+    def _build_sub_requests(self, encoding: _EncodingTypes) -> list[gnmi_pb2.SubscribeRequest]:
         req_list = []
-        sample_interval = int(self._config.scrape_interval * pow(10, 9) / self._config.oversampling)
+        sample_interval = self._config.scrape_interval * 1_000_000_000 // self._config.oversampling
 
-        for plugin_path in self._path_list:
+        for plugin_path, gnmi_paths in zip(self._path_list, self._gnmi_path_list):
             # Create SubscriptionList
             sublist = gnmi_pb2.SubscriptionList(prefix=gnmi_pb2.Path(target=plugin_path.target),
                                                 mode='STREAM',
                                                 subscription=[],
                                                 qos=None,
                                                 allow_aggregation=False,
-                                                encoding=self._selected_encoding.name,
+                                                encoding=encoding.name,
                                                 updates_only=False)
 
             # Create Subscriptions and add them to SubScriptionList
-            sample_interval = int(self._config.scrape_interval * pow(10, 9) / self._config.oversampling)
-            for xpath in plugin_path.xpath_list:
-                try:
-                    path = utils.xpath_to_gnmi(xpath=xpath, origin=plugin_path.origin)
-                except utils.XpathError as e:
-                    logging.error(f"The xpath {xpath} is malformed.")
-                    continue
-
+            for path in gnmi_paths:
                 sublist.subscription.append(gnmi_pb2.Subscription(path=path,
                                                                   mode='SAMPLE',
                                                                   sample_interval=sample_interval,
@@ -246,17 +305,20 @@ class GnmiClient(threading.Thread):
             # Create request and add to the request list
             req_list.append(gnmi_pb2.SubscribeRequest(subscribe=sublist))
 
-        # Subscribe to target
-        def generate(rlist: list[gnmi_pb2.SubscribeRequest]) -> Iterable[gnmi_pb2.SubscribeRequest]:
-            for req in rlist:
-                yield req
-        try:
-            return stub.Subscribe(generate(req_list), metadata=self._creds)
-        except grpc.RpcError as rpc_error:
-            raise DialError(f"gNMI stream from {self._target} failed with: {rpc_error.code()}"
-                            f" - details: {rpc_error.details()}")
+        return req_list
+
+    @staticmethod
+    def _parse_xpaths(plugin_path: ct.GnmiPaths) -> list[gnmi_pb2.Path]:
+        """Converts plugin xpaths to gNMI Path objects, skipping the malformed ones"""
+        path_list = []
+        for xpath in plugin_path.xpath_list:
+            try:
+                path_list.append(utils.get_cached_path(xpath=xpath, origin=plugin_path.origin))
+            except utils.XpathError:
+                logging.error(f"The xpath {xpath} is malformed.")
+        return path_list
 
-    def _parse_config(self, global_cfg: dict[str, str], device_cfg: dict[str, Any]) -> None:
+    def _parse_config(self, global_cfg: dict[str, Any], device_cfg: dict[str, Any]) -> None:
         """Parse and load config data"""
         # From global configuration
         if 'scrape_interval' in global_cfg:
@@ -268,77 +330,78 @@ class GnmiClient(threading.Thread):
 
         # From device configuration
         if 'force_encoding' in device_cfg:
-            self._config.force_encoding = device_cfg['force_encoding']
+            self._config.force_encoding = str(device_cfg['force_encoding'])
         if 'bypass_msg_routing' in device_cfg:
             self._config.bypass_msg_routing = bool(device_cfg['bypass_msg_routing'])
         if 'name' in device_cfg and device_cfg['name']:
-            self._config.dev_name = device_cfg['name']
+            self._config.dev_name = str(device_cfg['name'])
         if 'ip' in device_cfg and device_cfg['ip']:
-            self._config.ip = device_cfg['ip']
+            self._config.ip = str(device_cfg['ip'])
         if 'port' in device_cfg:
             self._config.port = int(device_cfg['port'])
         if 'user' in device_cfg:
-            self._config.user = device_cfg['user']
+            self._config.user = str(device_cfg['user'])
         if 'password' in device_cfg:
-            self._config.password = device_cfg['password']
+            self._config.password = str(device_cfg['password'])
         if 'plugins' in device_cfg and isinstance(device_cfg['plugins'], set):
             self._config.plugins = device_cfg['plugins'].copy()
 
 
-class _GnmiCollector(threading.Thread):
-    def __init__(self, sub_response: gnmi_pb2.SubscribeResponse,
+class _GnmiCollector:
+    def __init__(self, sub_response: grpc.aio.StreamStreamCall,
                  gnmi_sr_callback: Callable[[gnmi_pb2.SubscribeResponse], None],
                  keepalive: Callable,
                  dev_name: str):
-        super().__init__()
         self._gnmi_stream = sub_response
         self._callback = gnmi_sr_callback
         self._keepalive = keepalive
         self._dev_name = dev_name
+        self._task: asyncio.Task
 
-    def run(self):
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
         try:
-            self._gnmi_stream: Iterable[gnmi_pb2.SubscribeResponse]  # type: ignore
-            for sr in self._gnmi_stream:
+            async for sr in self._gnmi_stream:
                 self._keepalive()
                 self._callback(sr)
         except grpc.RpcError as rpc_error:
             logging.info(f"gNMI stream from {self._dev_name} exited with: {rpc_error.code()}")
             return
 
-    def wait_for_stop(self) -> None:
-        self.join()
+    async def wait_for_stop(self) -> None:
+        # The channel may be shared with other clients: cancel just this stream
+        self._gnmi_stream.cancel()
+        self._task.cancel()
+        await asyncio.wait((self._task,))
 
 
-class _WatchDog(threading.Thread):
+class _WatchDog:
     def __init__(self, timeout: int, expired_handler: Callable):
-        super().__init__()
         self._fire = expired_handler
         self._timeout: int = timeout
-        self._counter: int = timeout
-        self._exit: bool = False
-        self._event = threading.Event()
-        self._mutex = threading.Lock()
-
-    def run(self) -> None:
-        while self._counter:
-            self._event.wait(1)
-            with self._mutex:
-                if self._exit:
-                    return
-                self._counter -= 1
-            self._event.clear()
+        self._loop = asyncio.get_running_loop()
+        self._deadline: float = 0.0
+        self._task: asyncio.Task
+
+    def start(self) -> None:
+        # The countdown starts now, not at construction time (dialing may take a while)
+        self.kick()
+        self._task = asyncio.create_task(self.run())
 
-        # Expired
-        self._fire()
-        return
+    async def run(self) -> None:
+        # Sleep until the deadline. Kicks just move the deadline forward and are checked on wakeup
+        while True:
+            remaining = self._deadline - self._loop.time()
+            if remaining <= 0:
+                # Expired
+                self._fire()
+                return
+            await asyncio.sleep(remaining)
 
     def kick(self) -> None:
-        with self._mutex:
-            self._counter = self._timeout
+        self._deadline = self._loop.time() + self._timeout
 
     def stop(self) -> None:
-        with self._mutex:
-            self._exit = True
-        self._event.set()
-        self.join()
+        self._task.cancel()
@@ -18,22 +18,12 @@ https://raw.githubusercontent.com/google/gnxi/master/gnmi_cli_py/py_gnmicli.py
 """
 
 # Modules
-import re
+import functools
 from typing import Optional
 
 # Local modules
 from src.gnmi_pb2.gnmi_pb2 import Path, PathElem
 
-# Constants
-_RE_PATH_COMPONENT = re.compile(r'''
-^
-(?P<pname>[^[]+)  # gNMI path name
-(\[(?P<key>\w\D+)   # gNMI path key
-=
-(?P<value>.*)    # gNMI path value
-\])?$
-''', re.VERBOSE)
-
 
 class Error(Exception):
     """Module-level Exception class."""
@@ -43,6 +33,7 @@ class XpathError(Error):
     """Error parsing xpath provided."""
 
 
+@functools.lru_cache(maxsize=256)
 def xpath_to_gnmi(xpath: str, origin: str = 'openconfig', target: Optional[str] = None) -> Path:
     """Parses the xpath names and returns a gNMI Path Class object.
 
@@ -56,25 +47,51 @@ def xpath_to_gnmi(xpath: str, origin: str = 'openconfig', target: Optional[str]
 
     Returns:
       a gnmi_pb2.Path object representing the supplied xpath and origin.
+      Results are cached and shared among callers: do not mutate them (use CopyFrom() instead).
 
     Raises:
     XpathError: Unable to parse the xpath provided.
     """
     if not xpath or xpath == '/':
         raise XpathError('a blank xpath was provided.')
-    p_names = re.split(r'''/(?=(?:[^\[\]]|\[[^\[\]]+\])*$)''',
-                       xpath.strip('/').strip('/'))  # Removes leading/trailing '/'.
+    xpath = '/' + xpath.strip('/')  # Normalizes leading/trailing '/'.
     gnmi_elems = []
-    for word in p_names:
-        word_search = _RE_PATH_COMPONENT.search(word)
-        if not word_search:  # Invalid path specified.
-            raise XpathError('xpath component parse error: %s' % word)
-        if word_search.group('key') is not None:  # A path key was provided.
-            tmp_key = {}
-            for x in re.findall(r'\[([^]]*)\]', word):
-                tmp_key[x.split("=")[0]] = x.split("=")[-1]
-                gnmi_elems.append(PathElem(name=word_search.group(
-                  'pname'), key=tmp_key))
-        else:
-            gnmi_elems.append(PathElem(name=word, key={}))
+    pos, end = 0, len(xpath)
+    while pos < end:  # xpath[pos] is the '/' opening a path component.
+        start = pos + 1
+        stop = xpath.find('/', start)
+        bracket = xpath.find('[', start)
+        keys = {}
+        if bracket == -1 or -1 < stop < bracket:  # No path key provided.
+            stop = end if stop == -1 else stop
+            pname = xpath[start:stop]
+        else:  # One or more path keys were provided: name[key=value][key=value]...
+            pname, stop = xpath[start:bracket], bracket
+            while stop < end and xpath[stop] == '[':
+                close = xpath.find(']', stop)
+                key, eq, value = xpath[stop + 1:close].partition('=')
+                if close == -1 or not eq or not key or '[' in key:
+                    raise XpathError('xpath component parse error: %s' % xpath[start:])
+                keys[key] = value
+                stop = close + 1
+            if stop < end and xpath[stop] != '/':
+                raise XpathError('xpath component parse error: %s' % xpath[start:])
+        if not pname or ']' in pname:  # Invalid path specified.
+            raise XpathError('xpath component parse error: %s' % xpath[start:])
+        gnmi_elems.append(PathElem(name=pname, key=keys))
+        pos = stop
     return Path(elem=gnmi_elems, origin=origin, target=target)
+
+
+def get_cached_path(xpath: str, origin: str = 'openconfig', target: Optional[str] = None) -> Path:
+    """Returns a private copy of the cached gNMI Path for the supplied xpath.
+
+    The xpath is parsed only the first time it is seen (see xpath_to_gnmi),
+    later calls are served by a protobuf CopyFrom(). The returned object can be mutated.
+
+    Raises:
+    XpathError: Unable to parse the xpath provided.
+    """
+    path = Path()
+    path.CopyFrom(xpath_to_gnmi(xpath, origin, target))
+    return path
@@ -15,9 +15,17 @@
 """
 
 # Modules
+import os
+import json
 import argparse
 import logging
+import tempfile
 import yaml
+from typing import Any
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader  # type: ignore
 
 # Local Modules
 import src.core as core
@@ -33,28 +41,77 @@ def get_cmd_line():
     return args
 
 
+def _config_stamp(cfg_file: str) -> list[int]:
+    """ Identifies a config file revision: modification time (ns) and size """
+    st = os.stat(cfg_file)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _read_config_cache(cfg_file: str, cache_file: str) -> Any:
+    """ Returns the cached config tree, or None if the cache is missing or was built from another file revision """
+    try:
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+        if not isinstance(cache, dict) or cache.get('source') != _config_stamp(cfg_file):
+            return None
+        return cache.get('config')
+    except (OSError, ValueError):
+        return None
+
+
+def _write_config_cache(cfg_file: str, cache_file: str, raw_cfg: Any) -> None:
+    """ Atomically stores the parsed config tree as JSON. The cache is optional: failures are ignored """
+    try:
+        # JSON must give back the very same tree (e.g.: it turns int keys into strings)
+        if json.loads(json.dumps(raw_cfg)) != raw_cfg:
+            logging.debug("Configuration does not round-trip through JSON, not caching it.")
+            return
+    except (TypeError, ValueError) as e:
+        logging.debug(f"Unable to write configuration cache {cache_file}: {e}")
+        return
+
+    try:
+        source = _config_stamp(cfg_file)
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file) or '.', suffix='.tmp')
+    except OSError as e:
+        logging.debug(f"Unable to write configuration cache {cache_file}: {e}")
+        return
+
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'source': source, 'config': raw_cfg}, f)
+        os.replace(tmp_file, cache_file)
+    except (OSError, TypeError, ValueError) as e:
+        logging.debug(f"Unable to write configuration cache {cache_file}: {e}")
+        os.unlink(tmp_file)
+
+
 def load_config_from_file(cfg_file: str) -> dict:
-    """ Load app configuration """
+    """ Load app configuration. The parsed tree is cached as JSON next to the config file """
+    cache_file = cfg_file + '.cache.json'
     try:
-        with (open(cfg_file, 'r') as f):
-            raw_cfg = yaml.safe_load(f)
+        raw_cfg = _read_config_cache(cfg_file, cache_file)
+        if raw_cfg is None:
+            with (open(cfg_file, 'r') as f):
+                raw_cfg = yaml.load(f, Loader=SafeLoader)
+            _write_config_cache(cfg_file, cache_file, raw_cfg)
 
-            if not raw_cfg and not isinstance(raw_cfg, dict):
-                logging.error('Invalid configuration file. Quitting application...')
-                return {}
+        if not raw_cfg and not isinstance(raw_cfg, dict):
+            logging.error('Invalid configuration file. Quitting application...')
+            return {}
 
-            if 'global' not in raw_cfg or not isinstance(raw_cfg['global'], dict):
-                logging.error('Missing <global> section. Quitting application...')
-                return {}
+        if 'global' not in raw_cfg or not isinstance(raw_cfg['global'], dict):
+            logging.error('Missing <global> section. Quitting application...')
+            return {}
 
-            if 'device_template' not in raw_cfg or not isinstance(raw_cfg['device_template'], dict):
-                logging.warning('Missing <device_template> section. All ok?')
+        if 'device_template' not in raw_cfg or not isinstance(raw_cfg['device_template'], dict):
+            logging.warning('Missing <device_template> section. All ok?')
 
-            if 'devices' not in raw_cfg or not isinstance(raw_cfg['devices'], list) or not raw_cfg['devices']:
-                logging.error('The devices is empty or invalid. Quitting application...')
-                return {}
+        if 'devices' not in raw_cfg or not isinstance(raw_cfg['devices'], list) or not raw_cfg['devices']:
+            logging.error('The devices is empty or invalid. Quitting application...')
+            return {}
 
-            return raw_cfg
+        return raw_cfg
 
     except FileNotFoundError:
         logging.error(f"Configuration file {cfg_file} not found. Quitting application...")
@@ -14,9 +14,12 @@
 """
 
 # Modules
-import copy
+import sys
 import logging
+import operator
 import threading
+from collections import deque
+from collections.abc import Mapping
 from typing import Any
 from typing_extensions import Self
 from dataclasses import dataclass
@@ -29,26 +32,54 @@ import src.gnmi_pb2.gnmi_pb2 as gnmi_pb2
 from src.exporter.promexp import PromClient
 
 
+def typed_value(val: gnmi_pb2.TypedValue) -> Any:
+    """Returns the native value carried by a gNMI TypedValue"""
+    # WhichOneof() + getattr() are both served by the protobuf C extension: field tables,
+    # HasField() scans and ListFields() measured slower (up to 2x)
+    return getattr(val, val.WhichOneof('value'))
+
+
+def get_path_key(path_keys: list[Mapping[str, str]], index: int, name: str) -> str:
+    try:
+        # get(): protobuf maps insert missing keys on item access
+        key = path_keys[index].get(name)
+    except IndexError:
+        key = None
+    if key is None:
+        logging.error(f"The required path key is not available.")
+        return 'not_available'
+    return key
+
+
 class _GnmiMessage:
     def __init__(self, nf: gnmi_pb2.Notification):
         self.timestamp = nf.timestamp
         self.atomic = nf.atomic
         self.path: list[str] = []
-        self.path_keys: list[dict[str, str]] = []
+        # Path keys are the protobuf key maps themselves: read-only, never copied
+        self.path_keys: list[Mapping[str, str]] = []
 
         self.scan_gnmi_path(nf.prefix)
 
     def scan_gnmi_path(self, path: gnmi_pb2.Path) -> None:
         for pe in path.elem:
             self.path.append(pe.name)
-            self.path_keys.append(dict(pe.key))
+            self.path_keys.append(pe.key)
+
+    def derive(self, path: gnmi_pb2.Path) -> Self:
+        """Returns a new message of the same type, extending this message path with <path>.
+        Prefix key dicts are shared, not copied: messages are never mutated after creation.
+        """
+        msg = self.__class__.__new__(self.__class__)
+        msg.timestamp = self.timestamp
+        msg.atomic = self.atomic
+        msg.path = self.path.copy()
+        msg.path_keys = self.path_keys.copy()
+        msg.scan_gnmi_path(path)
+        return msg
 
     def get_path_key(self, index: int, name: str) -> str:
-        try:
-            return self.path_keys[index][name]
-        except (IndexError, KeyError):
-            logging.error(f"The required path key is not available.")
-            return 'not_available'
+        return get_path_key(self.path_keys, index, name)
 
 
 class GnmiUpdate(_GnmiMessage):
@@ -58,21 +89,18 @@ class GnmiUpdate(_GnmiMessage):
         self.duplicates: int = 0
 
     def new_upd_msg(self, upd_msg: gnmi_pb2.Update) -> Self:
-        msg = copy.deepcopy(self)
-        msg.scan_gnmi_path(upd_msg.path)
-        msg.val = getattr(upd_msg.val, upd_msg.val.WhichOneof('value'))
+        msg = self.derive(upd_msg.path)
+        msg.val = typed_value(upd_msg.val)
         msg.duplicates = upd_msg.duplicates
         return msg
 
 
 class GnmiDelete(_GnmiMessage):
     def new_del_msg(self, del_msg: gnmi_pb2.Path) -> Self:
-        msg = copy.deepcopy(self)
-        msg.scan_gnmi_path(del_msg)
-        return msg
+        return self.derive(del_msg)
 
 
-@dataclass
+@dataclass(slots=True)
 class _BasePluginConfig:
     """Device base Class configuration"""
     instance_name: str = 'default'
@@ -82,12 +110,12 @@ class _BasePluginConfig:
 
 class BasePlugin(ABC):
     """gNMI messages parser base Class"""
-    def __init__(self, global_cfg: dict[str, str], device_cfg: dict[str, Any], exporter: PromClient):
+    def __init__(self, global_cfg: dict[str, Any], device_cfg: dict[str, Any], exporter: PromClient):
         self.config = _BasePluginConfig()
         self._parse_config(global_cfg, device_cfg)
 
         # Object logic
-        self._buffer: list[gnmi_pb2.Notification] = []  # type: ignore
+        self._buffer: deque[gnmi_pb2.Notification] = deque()  # type: ignore
         self._mutex = threading.Lock()
         self._on_sync: bool = False
 
@@ -108,52 +136,58 @@ class BasePlugin(ABC):
         pass
 
     def gnmi_notification_handler(self, msg: gnmi_pb2.Notification) -> None:
-        with self._mutex:
-            self._buffer.append(msg)
+        # deque.append() is atomic: the mutex only guards buffer swaps
+        self._buffer.append(msg)
 
     def set_sync_status(self, on_sync: bool) -> None:
         with self._mutex:
             # Clear buffer on True->False transition
             if not on_sync and self._on_sync:
-                self._buffer.clear()
+                self._buffer = deque()
 
             self._on_sync = on_sync
 
-    def checkout(self):
+    def consume_update(self, prefix: GnmiUpdate, upd_msg: gnmi_pb2.Update) -> None:
+        """Unpacks a single gNMI Update. By default, it is appended to update_list.
+        Plugins may override it to process updates in place, without building GnmiUpdate objects.
+        <prefix> carries the notification timestamp and prefix path, it must not be mutated.
+        """
+        self.update_list.append(prefix.new_upd_msg(upd_msg))
+
+    def checkout(self) -> int:
+        """Unpacks buffered notifications, in timestamp order. Returns the number of notifications."""
         # Clear output lists
         self.update_list.clear()
         self.delete_list.clear()
 
         # Get the notification buffer content
-        nf_buf: list[gnmi_pb2.Notification] = []  # type: ignore
+        nf_buf: deque[gnmi_pb2.Notification] = deque()  # type: ignore
         with self._mutex:
             if self._on_sync:
-                nf_buf = copy.deepcopy(self._buffer)
-                self._buffer.clear()
+                self._buffer, nf_buf = deque(), self._buffer
 
-        # Unpack notifications into Update and Delete objects
-        for nf in nf_buf:
+        # Unpack notifications into Update and Delete objects.
+        # Messages inherit the notification timestamp: sorting notifications keeps output lists sorted.
+        for nf in sorted(nf_buf, key=operator.attrgetter('timestamp')):
             g_update = GnmiUpdate(nf)
             g_delete = GnmiDelete(nf)
 
             for nf_upd in nf.update:
-                self.update_list.append(g_update.new_upd_msg(nf_upd))
+                self.consume_update(g_update, nf_upd)
 
             for nf_del in nf.delete:
                 self.delete_list.append(g_delete.new_del_msg(nf_del))
 
-        # Sort messages by timestamp
-        self.update_list.sort(key=lambda msg: msg.timestamp)
-        self.delete_list.sort(key=lambda msg: msg.timestamp)
+        return len(nf_buf)
 
-    def _parse_config(self, global_cfg: dict[str, str], device_cfg: dict[str, Any]) -> None:
+    def _parse_config(self, global_cfg: dict[str, Any], device_cfg: dict[str, Any]) -> None:
         """ Parse and load config """
         # From global configuration
         if 'instance_name' in global_cfg:
-            self.config.instance_name = global_cfg['instance_name']
+            self.config.instance_name = sys.intern(str(global_cfg['instance_name']))
         if 'metric_prefix' in global_cfg:
-            self.config.metric_prefix = global_cfg['metric_prefix']
+            self.config.metric_prefix = str(global_cfg['metric_prefix'])
 
         # From device configuration
         if 'name' in device_cfg:
-            self.config.dev_name = device_cfg['name']
+            self.config.dev_name = sys.intern(str(device_cfg['name']))
@@ -14,15 +14,17 @@
 """
 
 # Modules
-import re
+import sys
 import time
+import itertools
 import logging
 from typing import Any
-from collections.abc import Iterable
+from collections.abc import Callable, Iterable, Mapping
 
 # Local modules
 import src.common_types as common_types
 import src.plugins.base_plug as base_plug
+import src.gnmi_pb2.gnmi_pb2 as gnmi_pb2
 from src.exporter.promexp import PromClient
 
 # Constants
@@ -32,7 +34,7 @@ _PATHS_TO_SUBSCRIBE = common_types.GnmiPaths(xpath_list=['/interfaces/interface/
                                              datamodels=[_DATA_MODEL],
                                              origin='openconfig',
                                              target='oc_interfaces')
-# Labels and metrics names (derived from data-model)
+# Labels and metrics names (derived from data-model). 'name' must come first in label sets
 _PLUGIN_LABEL_SET = ['instance-name', 'data-model', 'device']
 _SUBIFACE_LABEL_SET = ['name', 'index', 'mtu', 'description', 'ifindex', 'admin-status', 'oper-status']
 _SUBIFACE_METRIC_SET = ['in-octets', 'in-pkts', 'in-unicast-pkts', 'in-broadcast-pkts',
@@ -42,94 +44,95 @@ _SUBIFACE_METRIC_SET = ['in-octets', 'in-pkts', 'in-unicast-pkts', 'in-broadcast
                         'carrier-transitions']
 _IFACE_LABEL_SET = ['name', 'mtu', 'description', 'ifindex', 'admin-status', 'oper-status']
 _IFACE_METRIC_SET = _SUBIFACE_METRIC_SET + ['resets']
+# Leaf names lookup sets (update handlers hot path)
+_IFACE_LABEL_KEYS = frozenset(_IFACE_LABEL_SET)
+_IFACE_METRIC_KEYS = frozenset(_IFACE_METRIC_SET)
+_SUBIFACE_LABEL_KEYS = frozenset(_SUBIFACE_LABEL_SET)
+_SUBIFACE_METRIC_KEYS = frozenset(_SUBIFACE_METRIC_SET)
+# Prometheus compliant label sets
+_IFACE_BUNDLE_LABELSET = [label.replace('-', '_') for label in _PLUGIN_LABEL_SET + _IFACE_LABEL_SET]
+_SUBIFACE_BUNDLE_LABELSET = [label.replace('-', '_') for label in _PLUGIN_LABEL_SET + _SUBIFACE_LABEL_SET]
 
 
 # Data model keys indexes
 _IFACE_PATH_NAME = 1, 'name'
 _SUBIFACE_PATH_INDEX = 3, 'index'
 
+# Data model paths
+_IFACE_STATE_PREFIX = ('interfaces', 'interface', 'state')
+_SUBIFACE_STATE_PREFIX = ('interfaces', 'interface', 'subinterfaces', 'subinterface', 'state')
 
-class IfaceTable:
-    def __init__(self):
-        # outer key: interface full name (e.g.: 'eth1' or 'eth1.100')
-        # inner key: entry name (e.g.: 'in-octets' or 'oper-status')
-        self.table: dict[str, dict[str, Any]] = {}  # type: ignore
-
-    def add_table_entry(self, if_full_name: str, label_tpl: list[str], metric_tpl: list[str]) -> None:
-        """Adds the metrics skeleton of an interface to the table, following the template structure"""
-        try:
-            if if_full_name in self.table:
-                return
-            # Create interface entry
-            self.table.update({if_full_name: {'name': ''}})
-
-            # Fill up the newly created record with the template
-            for label in label_tpl:
-                self.table[if_full_name][label] = ''
-            for metric in metric_tpl:
-                self.table[if_full_name][metric] = 0
 
-        except KeyError:
-            logging.debug(f"Interface table entry {if_full_name} creation failed.")
+class IfaceTable:
+    def __init__(self, label_tpl: list[str], metric_tpl: list[str]):
+        # Column-oriented table: one list per entry name (e.g.: 'in-octets' or 'oper-status')
+        # and a row index per interface full name (e.g.: 'eth1' or 'eth1.100')
+        self._defaults: dict[str, Any] = {'name': ''}
+        self._defaults.update({label: '' for label in label_tpl})
+        self._defaults.update({metric: 0 for metric in metric_tpl})
+        self._row_of: dict[str, int] = {}
+        self._cols: dict[str, list[Any]] = {entry: [] for entry in self._defaults}
+
+    def __contains__(self, if_full_name: str) -> bool:
+        return if_full_name in self._row_of
+
+    def add_table_entry(self, if_full_name: str, seed: dict[str, Any]) -> None:
+        """Adds an interface row to the table, filled up with <seed> values and the template defaults"""
+        if if_full_name in self._row_of:
+            return
+        self._row_of[if_full_name] = len(self._row_of)
+        for entry, default in self._defaults.items():
+            self._cols[entry].append(seed.get(entry, default))
 
     def update_table_entry(self, if_full_name: str, entry_name: str, entry_val: Any) -> None:
         try:
-            self.table[if_full_name][entry_name] = entry_val
+            self._cols[entry_name][self._row_of[if_full_name]] = entry_val
         except KeyError:
             logging.debug(f"Interface {if_full_name} table entry {entry_name} update failed.")
 
-    def items(self) -> Iterable[str]:
-        for iface in self.table:
-            yield iface
+    def iter_rows(self, entry_names: Iterable[str]) -> Iterable[tuple[Any, ...]]:
+        """Yields, in row order, a tuple with the <entry_names> values of each interface"""
+        return zip(*[self._cols[entry] for entry in entry_names])
 
-    def get_entry(self, if_name: str, entry_name: str) -> Any:
-        try:
-            return self.table[if_name][entry_name]
-        except KeyError:
-            logging.debug(f"oc-interfaces: {entry_name} not found in {if_name}.")
-            return ' '
+    def column(self, entry_name: str) -> list[Any]:
+        """Returns the <entry_name> values of all interfaces, in row order"""
+        return self._cols[entry_name]
 
     def clear(self):
-        self.table.clear()
-
-
-class MetricTable:
-    def __init__(self):
-        # outer key: metric name
-        self.table: dict[str, list[common_types.GnmiMetric]] = {}  # type: ignore
-
-    def add_metric(self, name: str, metric: common_types.GnmiMetric) -> None:
-        if name not in self.table:
-            self.table[name] = []
-        self.table[name].append(metric)
-
-    def get_metrics(self, name: str) -> Iterable[common_types.GnmiMetric]:
-        try:
-            for metric in self.table[name]:
-                yield metric
-        except KeyError:
-            logging.debug(f"oc-interfaces: Metric {name} not found in table.")
-            yield common_types.GnmiMetric()
-
-    def clear(self) -> None:
-        self.table.clear()
+        self._row_of.clear()
+        for col in self._cols.values():
+            col.clear()
 
 
 class OcInterfaces(base_plug.BasePlugin):
-    def __init__(self, global_cfg: dict[str, str], device_cfg: dict[str, Any], exporter: PromClient):
+    def __init__(self, global_cfg: dict[str, Any], device_cfg: dict[str, Any], exporter: PromClient):
         super().__init__(global_cfg, device_cfg, exporter)
 
         # Interface tables
-        self.iface_table = IfaceTable()
-        self.subiface_table = IfaceTable()
+        self.iface_table = IfaceTable(label_tpl=_IFACE_LABEL_SET, metric_tpl=_IFACE_METRIC_SET)
+        self.subiface_table = IfaceTable(label_tpl=_SUBIFACE_LABEL_SET, metric_tpl=_SUBIFACE_METRIC_SET)
 
-        # Metric tables
-        self.iface_metrics_table = MetricTable()
-        self.subiface_metrics_table = MetricTable()
+        # Metric bundles, one per metric name (filled up at every scrape)
+        self._iface_bundles = {name: self._new_bundle(f"iface_{name.replace('-', '_')}", _IFACE_BUNDLE_LABELSET)
+                               for name in _IFACE_METRIC_SET}
+        self._subiface_bundles = {name: self._new_bundle(f"subiface_{name.replace('-', '_')}",
+                                                         _SUBIFACE_BUNDLE_LABELSET)
+                                  for name in _SUBIFACE_METRIC_SET}
 
         # Metric bundles list (module output)
         self.bundle_list: list[common_types.GnmiMetricBundle] = []
 
+        # Update handlers, keyed by the first three path elements
+        self._dispatch: dict[tuple[str, ...], Callable[[list[str], list[Mapping[str, str]], Any], None]] = {
+            _IFACE_STATE_PREFIX: self._update_iface,
+            _SUBIFACE_STATE_PREFIX[:3]: self._update_subiface}
+
+    def _new_bundle(self, name: str, labelset: list[str]) -> common_types.GnmiMetricBundle:
+        return common_types.GnmiMetricBundle(type=common_types.GnmiMetricType.COUNTER,
+                                             device_name=self.config.dev_name,
+                                             metric_name=f"{self.config.metric_prefix}_{name}",
+                                             labelset=labelset)
+
     def get_paths(self) -> common_types.GnmiPaths:
         """Returns paths to be subscribed"""
         return _PATHS_TO_SUBSCRIBE
@@ -142,16 +145,10 @@ class OcInterfaces(base_plug.BasePlugin):
         self.clear_all_tables()
 
         # Get gNMI messages from buffer
-        self.checkout()
-        if not self.update_list:
+        # (interface and subinterface tables are loaded in place, see consume_update())
+        if not self.checkout():
             return []
 
-        # Creates empty interface and subinterface table
-        self.build_tables()
-
-        # Loads interface and subinterface table with device gNMI data
-        self.update_tables()
-
         # Build the metrics table (from interface tables)
         self.build_metrics()
 
@@ -164,133 +161,94 @@ class OcInterfaces(base_plug.BasePlugin):
         """Wipes object data structures before being populated."""
         self.iface_table.clear()
         self.subiface_table.clear()
-        self.iface_metrics_table.clear()
-        self.subiface_metrics_table.clear()
-        self.bundle_list.clear()
-
-    def build_tables(self) -> None:
-        """Scans the message buffer for interface names and builds the table skeleton
-        -- Call after checkout() --
+        # Fresh lists: bundles returned by the previous scrape may still be in use by the exporter
+        for bundle in itertools.chain(self._iface_bundles.values(), self._subiface_bundles.values()):
+            bundle.metrics = []
+        self.bundle_list = []
+
+    def consume_update(self, prefix: base_plug.GnmiUpdate, upd_msg: gnmi_pb2.Update) -> None:
+        """Populates interface tables with gNMI data, straight from the notification update.
+        Table entries are created on the first update seen for an interface.
+        -- Called by checkout() --
         """
-        for update in self.update_list:
-            path_str = ''.join(update.path)
-
-            # Interfaces
-            # TODO: Maybe it is safer to match the container instead the leaf "name". Less efficient but safer.
-            if re.fullmatch('interfacesinterfacestatename', path_str):
-                fullname = update.get_path_key(*_IFACE_PATH_NAME)
-                self.iface_table.add_table_entry(if_full_name=fullname,
-                                                 label_tpl=_IFACE_LABEL_SET,
-                                                 metric_tpl=_IFACE_METRIC_SET)
-
-            # Subinterfaces
-            if re.fullmatch('interfacesinterfacesubinterfacessubinterfacestatename', path_str):
-                fullname = ''.join([update.get_path_key(*_IFACE_PATH_NAME), '.',
-                                    update.get_path_key(*_SUBIFACE_PATH_INDEX)])
-                self.subiface_table.add_table_entry(if_full_name=fullname,
-                                                    label_tpl=_SUBIFACE_LABEL_SET,
-                                                    metric_tpl=_SUBIFACE_METRIC_SET)
-
-    def update_tables(self) -> None:
-        """Scans the message buffer and populate interface table lists whit gNMI data.
-         -- Call after build_tables() --
-        """
-        for update in self.update_list:
-            path_str = ''.join(update.path)
-
-            # Interfaces
-            if re.match('interfacesinterfacestate', path_str):
-                if update.path[-1] in _IFACE_LABEL_SET:
-                    value = str(update.val)
-                elif update.path[-1] in _IFACE_METRIC_SET:
-                    value = int(update.val)  # type: ignore
-                else:
-                    continue
-                self.iface_table.update_table_entry(if_full_name=update.get_path_key(*_IFACE_PATH_NAME),
-                                                    entry_name=update.path[-1],
-                                                    entry_val=value)
-
-            # Subinterfaces
-            if re.match('interfacesinterfacesubinterfacessubinterfacestate', path_str):
-                if update.path[-1] in _SUBIFACE_LABEL_SET:
-                    value = str(update.val)
-                    if update.path[-1] == 'name':
-                        value = update.get_path_key(*_IFACE_PATH_NAME)
-                elif update.path[-1] in _SUBIFACE_METRIC_SET:
-                    value = int(update.val)  # type: ignore
-                else:
-                    continue
-                ifl = ''.join([update.get_path_key(*_IFACE_PATH_NAME), '.', update.get_path_key(*_SUBIFACE_PATH_INDEX)])
-                self.subiface_table.update_table_entry(if_full_name=ifl,
-                                                       entry_name=update.path[-1],
-                                                       entry_val=value)
+        path = prefix.path + [pe.name for pe in upd_msg.path.elem]
+        handler = self._dispatch.get(tuple(path[:3]))
+        if handler is not None:
+            path_keys = prefix.path_keys + [pe.key for pe in upd_msg.path.elem]
+            handler(path, path_keys, upd_msg.val)
+
+    def _update_iface(self, path: list[str], path_keys: list[Mapping[str, str]], val: Any) -> None:
+        """Handles updates under /interfaces/interface/state"""
+        leaf = path[-1]
+        value: str | int
+        if leaf in _IFACE_LABEL_KEYS:
+            value = sys.intern(str(base_plug.typed_value(val)))
+        elif leaf in _IFACE_METRIC_KEYS:
+            value = int(base_plug.typed_value(val))
+        else:
+            return
+        fullname = base_plug.get_path_key(path_keys, *_IFACE_PATH_NAME)
+        if fullname not in self.iface_table:
+            # Label the row from path keys: the name leaf may be missing from this scrape window
+            self.iface_table.add_table_entry(if_full_name=fullname, seed={'name': sys.intern(fullname)})
+        self.iface_table.update_table_entry(if_full_name=fullname, entry_name=leaf, entry_val=value)
+
+    def _update_subiface(self, path: list[str], path_keys: list[Mapping[str, str]], val: Any) -> None:
+        """Handles updates under /interfaces/interface/subinterfaces/subinterface/state"""
+        if tuple(path[3:5]) != _SUBIFACE_STATE_PREFIX[3:]:
+            return
+        leaf = path[-1]
+        if_name = base_plug.get_path_key(path_keys, *_IFACE_PATH_NAME)
+        value: str | int
+        if leaf == 'name':
+            # Subinterfaces are labelled with their parent interface name
+            value = sys.intern(if_name)
+        elif leaf in _SUBIFACE_LABEL_KEYS:
+            value = sys.intern(str(base_plug.typed_value(val)))
+        elif leaf in _SUBIFACE_METRIC_KEYS:
+            value = int(base_plug.typed_value(val))
+        else:
+            return
+        index = base_plug.get_path_key(path_keys, *_SUBIFACE_PATH_INDEX)
+        fullname = f"{if_name}.{index}"
+        if fullname not in self.subiface_table:
+            # Label the row from path keys: name and index leaves may be missing from this scrape window
+            self.subiface_table.add_table_entry(if_full_name=fullname,
+                                                seed={'name': sys.intern(if_name), 'index': sys.intern(index)})
+        self.subiface_table.update_table_entry(if_full_name=fullname, entry_name=leaf, entry_val=value)
 
     def build_metrics(self) -> None:
-        """Scans interface tables and builds the metrics table
-        -- Call after update_tables() --
+        """Scans interface tables and fills up the metric bundles
+        -- Call after checkout() --
         """
+        plugin_labelval = (self.config.instance_name, _DATA_MODEL, self.config.dev_name)
+        # TODO: Timestamp was lost somewhere and not available here... Fix it!
+        now = time.time()
+
         # Interfaces
+        # build metric label values (once per interface, shared by all its metrics)
+        # (rows without a name are never exported)
+        labelvals = [plugin_labelval + row if row[0] else None for row in self.iface_table.iter_rows(_IFACE_LABEL_SET)]
         for metric in _IFACE_METRIC_SET:
-            for iface in self.iface_table.items():
-                gnmi_metric = common_types.GnmiMetric(labelval=[self.config.instance_name,
-                                                                _DATA_MODEL,
-                                                                self.config.dev_name])
-                # build metric label values
-                for label in _IFACE_LABEL_SET:
-                    gnmi_metric.labelval.append(self.iface_table.get_entry(if_name=iface, entry_name=label))
-
-                # get value and timestamp
-                gnmi_metric.val = self.iface_table.get_entry(if_name=iface, entry_name=metric)
-                # TODO: Timestamp was lost somewhere and not available here... Fix it!
-                gnmi_metric.ts = time.time()
-                self.iface_metrics_table.add_metric(name=metric, metric=gnmi_metric)
+            bundle = self._iface_bundles[metric]
+            for labelval, val in zip(labelvals, self.iface_table.column(metric)):
+                if labelval is not None:
+                    bundle.add_metric(labelval=labelval, val=val, ts=now)
 
         # Subinterfaces
+        # build metric label values (once per subinterface, shared by all its metrics)
+        # (rows without a name are never exported)
+        labelvals = [plugin_labelval + row if row[0] else None for row in self.subiface_table.iter_rows(_SUBIFACE_LABEL_SET)]
         for metric in _SUBIFACE_METRIC_SET:
-            for iface in self.subiface_table.items():
-                gnmi_metric = common_types.GnmiMetric(labelval=[self.config.instance_name,
-                                                                _DATA_MODEL,
-                                                                self.config.dev_name])
-                # build metric label values
-                for label in _SUBIFACE_LABEL_SET:
-                    gnmi_metric.labelval.append(self.subiface_table.get_entry(if_name=iface, entry_name=label))
-
-                # get value and timestamp
-                gnmi_metric.val = self.subiface_table.get_entry(if_name=iface, entry_name=metric)
-                # TODO: Timestamp was lost somewhere and not available here... Fix it!
-                gnmi_metric.ts = time.time()
-                self.subiface_metrics_table.add_metric(name=metric, metric=gnmi_metric)
+            bundle = self._subiface_bundles[metric]
+            for labelval, val in zip(labelvals, self.subiface_table.column(metric)):
+                if labelval is not None:
+                    bundle.add_metric(labelval=labelval, val=val, ts=now)
 
     def build_bundle_list(self) -> None:
-        """Scans metric tables and build the metric bundle list
+        """Collects the non-empty metric bundles into the bundle list
         -- Call alter build_metrics() --
         """
-        # Interfaces
-        label_set = []
-        for label in _PLUGIN_LABEL_SET + _IFACE_LABEL_SET:
-            label_set.append(label.replace('-', '_'))
-        for name in _IFACE_METRIC_SET:
-            metric_name = ''.join([self.config.metric_prefix, '_iface_', name.replace('-', '_')])
-            bundle = common_types.GnmiMetricBundle(type=common_types.GnmiMetricType.COUNTER,
-                                                   device_name=self.config.dev_name,
-                                                   metric_name=metric_name,
-                                                   labelset=label_set)
-            for metric in self.iface_metrics_table.get_metrics(name=name):
-                bundle.metrics.append(metric)
-
-            self.bundle_list.append(bundle)
-
-        # Subinterfaces
-        label_set = []
-        for label in _PLUGIN_LABEL_SET + _SUBIFACE_LABEL_SET:
-            label_set.append(label.replace('-', '_'))
-        for name in _SUBIFACE_METRIC_SET:
-            metric_name = ''.join([self.config.metric_prefix, '_subiface_', name.replace('-', '_')])
-            bundle = common_types.GnmiMetricBundle(type=common_types.GnmiMetricType.COUNTER,
-                                                   device_name=self.config.dev_name,
-                                                   metric_name=metric_name,
-                                                   labelset=label_set)
-            for metric in self.subiface_metrics_table.get_metrics(name=name):
-                bundle.metrics.append(metric)
-
-            self.bundle_list.append(bundle)
+        self.bundle_list = [bundle for bundle in itertools.chain(self._iface_bundles.values(),
+                                                                 self._subiface_bundles.values())
+                            if bundle.metrics]